@@ -2,13 +2,21 @@ import os
 import re
 import logging
 import sys
+import time
 from telebot import TeleBot
+from telebot.apihelper import ApiTelegramException
 from dotenv import load_dotenv
 from video_parser import get_video_info, extract_video_id
 from youtube_parser import get_playlist_info, extract_playlist_id
+from channel_parser import (
+    get_channel_updates, extract_channel_ref, load_index, get_chat_index, update_chat_index,
+    start_channel_run, finish_channel_run, mark_playlist_posted, mark_video_posted,
+    index_lock, CHANNEL_MAX_WORKERS
+)
 from post_image import make_cover
 from chatgpt import generate_post
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 
 # ==========================
 # Настройка общего логгера
@@ -32,10 +40,175 @@ if not TG_TOKEN:
 # Создаем экземпляр бота
 bot = TeleBot(TG_TOKEN)
 
+# Пауза между постами канала (Telegram ограничивает частоту сообщений в чат)
+CHANNEL_SEND_INTERVAL = 1
+# Сколько раз повторяем отправку, если Telegram ответил 429
+SEND_RETRIES = 5
+
 @bot.message_handler(commands=['start'])
 def send_welcome(message):
     logging.info("Команда /start получена")
-    bot.send_message(message.chat.id, "Привет! Отправь мне ссылку на YouTube плейлист или видео, и я пришлю информацию и обложку.")
+    bot.send_message(message.chat.id, "Привет! Отправь мне ссылку на YouTube плейлист, видео или канал, и я пришлю информацию и обложку.")
+
+def format_playlist_info(data, clean_link):
+    """Текст с информацией о плейлисте для ChatGPT"""
+    course_info = f"📼 Название плейлиста: {data['title']}\n"
+    if data['course_year']:
+        course_info += f"📅 Год курса: {data['course_year']}\n"
+    course_info += f"📝 Описание: {data['description'] or 'Описание отсутствует'}\n"
+    course_info += f"⏳ Продолжительность курса: {data['total_hours']} часов\n"
+    course_info += f"🔗 Ссылка на курс: {clean_link}\n"
+    course_info += f"🎬 Всего видео: {len(data['videos'])}\n"
+    for idx, video in enumerate(data['videos'], 1):
+        course_info += f"\n{idx}. {video['title']}\n"
+        course_info += f"   📅 Дата публикации: {video['published'].strftime('%Y-%m-%d')}\n"
+        course_info += f"   ⏱ Продолжительность: {video['duration'] // 60} мин"
+
+    year_text = str(data['course_year']) if data['course_year'] else "Неизвестно"
+    duration_text = f"{data['total_hours']} часов"
+    return course_info, data['cover_url'], year_text, duration_text
+
+def format_video_info(data, clean_link):
+    """Текст с информацией о видео для ChatGPT"""
+    course_info = f"📼 Название курса: {data['title']}\n"
+    course_info += f"📅 Год курса: {data['course_year']}\n"
+    course_info += f"⏳ Продолжительность курса: {data['total_hours']} часов\n"
+    course_info += f"📝 Описание: {data['description'] or 'Описание отсутствует'}\n"
+    course_info += f"🔗 Ссылка на курс: {clean_link}"
+
+    year_text = str(data['course_year'])
+    duration_text = f"{data['total_hours']} часов"
+    return course_info, data['cover_url'], year_text, duration_text
+
+def build_post(course_info, poster_url, year_text, duration_text):
+    """Генерирует текст поста через ChatGPT и обложку к нему"""
+    logging.debug("Вызываем generate_post...")
+    post_text = generate_post(course_info)
+
+    if not post_text:
+        raise ValueError("Не удалось получить пост от ChatGPT (post_text == None)")
+
+    # Извлекаем заголовок и подзаголовок
+    lines = post_text.split('\n')
+    title_text = None
+    subtitle_text = None
+    for line in lines:
+        if line.strip().startswith('**') and line.strip().endswith('**'):
+            if title_text is None:
+                title_text = line.strip('*').strip()
+            elif subtitle_text is None:
+                subtitle_text = line.strip('*').strip()
+                break
+    
+    if subtitle_text is None:
+        # Ищем первую строку, которая может подойти на роль подзаголовка
+        for line in lines[1:]:
+            if line.strip() and not line.strip().startswith(('🗓', '⏰', '__', '🔹', '♦️')):
+                subtitle_text = line.strip()
+                break
+
+    logging.debug(f"Итоговые title_text='{title_text}' subtitle_text='{subtitle_text}'")
+
+    # Генерируем обложку
+    logging.debug("Создаём обложку...")
+    cover_image = make_cover(
+        poster_url,
+        title_text or "Без названия",
+        year_text,
+        duration_text,
+        subtitle_text
+    )
+    if not cover_image:
+        raise ValueError("make_cover вернула None или произошла ошибка при создании обложки.")
+
+    # Преобразуем изображение в байты
+    cover_image_bytes = BytesIO()
+    cover_image.seek(0)
+    cover_image_bytes.write(cover_image.getvalue())
+    cover_image_bytes.seek(0)
+
+    return post_text, cover_image_bytes
+
+def send_post(chat_id, post_text, cover_image_bytes):
+    """Отправка поста; при 429 ждём retry_after от Telegram и повторяем"""
+    logging.debug("Отправляем картинку пользователю...")
+    for attempt in range(SEND_RETRIES):
+        try:
+            cover_image_bytes.seek(0)
+            bot.send_photo(
+                chat_id,
+                cover_image_bytes,
+                caption=post_text,
+                parse_mode='HTML'
+            )
+            return
+        except ApiTelegramException as e:
+            if e.error_code != 429 or attempt == SEND_RETRIES - 1:
+                raise
+            retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+            logging.warning(f"Telegram просит подождать {retry_after} с перед отправкой")
+            time.sleep(retry_after)
+
+def handle_channel(message, url):
+    """Публикация новых и изменившихся плейлистов и новых видео канала"""
+    if not start_channel_run(message.chat.id, url):
+        bot.send_message(message.chat.id, "⏳ Этот канал уже публикуется, дождитесь окончания")
+        return
+    try:
+        publish_channel(message, url)
+    finally:
+        finish_channel_run(message.chat.id, url)
+
+def publish_channel(message, url):
+    logging.debug("Обнаружен канал, ищем обновления...")
+    chat_id = message.chat.id
+    with index_lock:
+        chat_index = get_chat_index(load_index(), chat_id)
+    updates = get_channel_updates(url, chat_index)
+    channel = updates['channel']
+
+    def record_unchanged(index):
+        # У пустых плейлистов и плейлистов с прежним составом сохраняем только etag
+        for playlist in updates['unchanged']:
+            mark_playlist_posted(index, channel['id'], playlist)
+
+    if updates['unchanged']:
+        update_chat_index(chat_id, record_unchanged)
+
+    jobs = []
+    for playlist in updates['playlists']:
+        clean_link = f"https://www.youtube.com/playlist?list={playlist['id']}"
+        jobs.append((mark_playlist_posted, playlist, format_playlist_info(playlist['data'], clean_link)))
+    for video in updates['videos']:
+        clean_link = f"https://youtu.be/{video['id']}"
+        jobs.append((mark_video_posted, video, format_video_info(video['data'], clean_link)))
+
+    if not jobs:
+        bot.send_message(chat_id, f"✅ На канале «{channel['title']}» нет новых плейлистов и видео")
+        return
+
+    bot.send_message(
+        chat_id,
+        f"📺 Канал «{channel['title']}»: плейлистов к публикации — {len(updates['playlists'])}, "
+        f"отдельных видео — {len(updates['videos'])}"
+    )
+
+    # Посты генерируются параллельно, а отправляются по очереди в исходном порядке
+    posted = 0
+    with ThreadPoolExecutor(max_workers=CHANNEL_MAX_WORKERS) as executor:
+        futures = [(executor.submit(build_post, *info), mark, item) for mark, item, info in jobs]
+        for future, mark, item in futures:
+            try:
+                post_text, cover_image_bytes = future.result()
+                send_post(chat_id, post_text, cover_image_bytes)
+            except Exception as e:
+                logging.error(f"Ошибка при публикации {item['id']}: {e}", exc_info=True)
+                continue
+            update_chat_index(chat_id, lambda index: mark(index, channel['id'], item))
+            posted += 1
+            time.sleep(CHANNEL_SEND_INTERVAL)
+
+    bot.send_message(chat_id, f"✅ Опубликовано {posted} из {len(jobs)}")
 
 @bot.message_handler(func=lambda message: True)
 def handle_message(message):
@@ -43,12 +216,10 @@ def handle_message(message):
     logging.debug(f"Получена ссылка: {url}")
 
     try:
-        # Инициализируем переменные, чтобы видно было, если что-то не заполнено
-        data = None
-        course_info = None
-        poster_url = None
-        year_text = "Неизвестно"
-        duration_text = "Неизвестно"
+        # Ссылка на канал проверяется первой: /@handle/playlists тоже содержит "/playlist"
+        if extract_channel_ref(url):
+            handle_channel(message, url)
+            return
 
         if "/playlist" in url:
             logging.debug("Обнаружен плейлист, парсим...")
@@ -57,21 +228,7 @@ def handle_message(message):
                 raise ValueError("get_playlist_info вернул None")
 
             clean_link = f"https://www.youtube.com/playlist?list={extract_playlist_id(url)}"
-            course_info = f"📼 Название плейлиста: {data['title']}\n"
-            if data['course_year']:
-                course_info += f"📅 Год курса: {data['course_year']}\n"
-            course_info += f"📝 Описание: {data['description'] or 'Описание отсутствует'}\n"
-            course_info += f"⏳ Продолжительность курса: {data['total_hours']} часов\n"
-            course_info += f"🔗 Ссылка на курс: {clean_link}\n"
-            course_info += f"🎬 Всего видео: {len(data['videos'])}\n"
-            for idx, video in enumerate(data['videos'], 1):
-                course_info += f"\n{idx}. {video['title']}\n"
-                course_info += f"   📅 Дата публикации: {video['published'].strftime('%Y-%m-%d')}\n"
-                course_info += f"   ⏱ Продолжительность: {video['duration'] // 60} мин"
-
-            poster_url = data['cover_url']
-            year_text = str(data['course_year']) if data['course_year'] else "Неизвестно"
-            duration_text = f"{data['total_hours']} часов"
+            info = format_playlist_info(data, clean_link)
 
         elif "/watch" in url or "youtu.be" in url:
             logging.debug("Обнаружено видео, парсим...")
@@ -80,74 +237,15 @@ def handle_message(message):
                 raise ValueError("get_video_info вернул None")
 
             clean_link = f"https://youtu.be/{extract_video_id(url)}"
-            course_info = f"📼 Название курса: {data['title']}\n"
-            course_info += f"📅 Год курса: {data['course_year']}\n"
-            course_info += f"⏳ Продолжительность курса: {data['total_hours']} часов\n"
-            course_info += f"📝 Описание: {data['description'] or 'Описание отсутствует'}\n"
-            course_info += f"🔗 Ссылка на курс: {clean_link}"
-
-            poster_url = data['cover_url']
-            year_text = str(data['course_year'])
-            duration_text = f"{data['total_hours']} часов"
+            info = format_video_info(data, clean_link)
 
         else:
             logging.warning("Неизвестный формат ссылки, отправляем ошибку пользователю.")
             bot.send_message(message.chat.id, "⛔ Неизвестный формат ссылки")
             return
 
-        # Генерируем пост через ChatGPT
-        logging.debug("Вызываем generate_post...")
-        post_text = generate_post(course_info)
-
-        if not post_text:
-            raise ValueError("Не удалось получить пост от ChatGPT (post_text == None)")
-
-        # Извлекаем заголовок и подзаголовок
-        lines = post_text.split('\n')
-        title_text = None
-        subtitle_text = None
-        for line in lines:
-            if line.strip().startswith('**') and line.strip().endswith('**'):
-                if title_text is None:
-                    title_text = line.strip('*').strip()
-                elif subtitle_text is None:
-                    subtitle_text = line.strip('*').strip()
-                    break
-        
-        if subtitle_text is None:
-            # Ищем первую строку, которая может подойти на роль подзаголовка
-            for line in lines[1:]:
-                if line.strip() and not line.strip().startswith(('🗓', '⏰', '__', '🔹', '♦️')):
-                    subtitle_text = line.strip()
-                    break
-
-        logging.debug(f"Итоговые title_text='{title_text}' subtitle_text='{subtitle_text}'")
-
-        # Генерируем обложку
-        logging.debug("Создаём обложку...")
-        cover_image = make_cover(
-            poster_url,
-            title_text or "Без названия",
-            year_text,
-            duration_text,
-            subtitle_text
-        )
-        if not cover_image:
-            raise ValueError("make_cover вернула None или произошла ошибка при создании обложки.")
-
-        # Преобразуем изображение в байты
-        cover_image_bytes = BytesIO()
-        cover_image.seek(0)
-        cover_image_bytes.write(cover_image.getvalue())
-        cover_image_bytes.seek(0)
-
-        logging.debug("Отправляем картинку пользователю...")
-        bot.send_photo(
-            message.chat.id,
-            cover_image_bytes,
-            caption=post_text,
-            parse_mode='HTML'
-        )
+        post_text, cover_image_bytes = build_post(*info)
+        send_post(message.chat.id, post_text, cover_image_bytes)
 
     except Exception as e:
         logging.error(f"Ошибка при обработке сообщения: {e}", exc_info=True)
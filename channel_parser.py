@@ -0,0 +1,339 @@
+import os
+import json
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from urllib.parse import urlparse, unquote
+from dotenv import load_dotenv
+from youtube_parser import get_playlist_info
+from video_parser import get_video_info
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Локальный индекс уже опубликованных плейлистов и видео
+CHANNEL_INDEX_PATH = os.getenv("CHANNEL_INDEX_PATH", "channel_index.json")
+# Сколько плейлистов/видео запрашиваем у YouTube API одновременно
+CHANNEL_MAX_WORKERS = int(os.getenv("CHANNEL_MAX_WORKERS", "8"))
+# TeleBot обрабатывает сообщения в нескольких потоках: чтение-изменение-запись
+# индекса выполняется под блокировкой, чтобы не терять чужие отметки
+index_lock = threading.Lock()
+# Каналы, которые сейчас публикуются, по (chat_id, ссылка на канал)
+_running_channels = set()
+_running_lock = threading.Lock()
+
+def extract_channel_ref(url):
+    """Извлекаем ссылку на канал: (тип, значение) или None.
+
+    Поддерживаются форматы youtube.com/channel/ID, youtube.com/@handle,
+    youtube.com/c/NAME и youtube.com/user/NAME (в том числе с хвостом
+    вида /videos или /playlists).
+    """
+    parsed = urlparse(url)
+    if 'youtube.com' not in parsed.netloc:
+        return None
+
+    parts = [unquote(p) for p in parsed.path.split('/') if p]
+    if not parts:
+        return None
+
+    if parts[0].startswith('@') and len(parts[0]) > 1:
+        return ('handle', parts[0])
+    if len(parts) >= 2:
+        if parts[0] == 'channel':
+            return ('id', parts[1])
+        if parts[0] == 'user':
+            return ('username', parts[1])
+        if parts[0] == 'c':
+            return ('custom', parts[1])
+    return None
+
+def _list_channels(youtube, **params):
+    return youtube.channels().list(
+        part='snippet,contentDetails',
+        **params
+    ).execute().get('items', [])
+
+def _find_by_custom_url(youtube, name):
+    """Ищем канал по старому адресу /c/NAME.
+
+    Большинство таких адресов теперь совпадают с @handle, поэтому сначала
+    пробуем его; поиск дороже по квоте и неточен, так что его результат
+    принимаем только при совпадении customUrl.
+    """
+    items = _list_channels(youtube, forHandle=name)
+    if items:
+        return items
+
+    found = youtube.search().list(
+        part='snippet',
+        q=name,
+        type='channel',
+        maxResults=5
+    ).execute()
+    channel_ids = [i['snippet']['channelId'] for i in found['items']]
+    if not channel_ids:
+        return []
+
+    wanted = name.lower().lstrip('@')
+    return [
+        item for item in _list_channels(youtube, id=','.join(channel_ids))
+        if item['snippet'].get('customUrl', '').lower().lstrip('@') == wanted
+    ]
+
+def resolve_channel(youtube, ref):
+    """Находим канал по ссылке: ID, название и плейлист загрузок"""
+    kind, value = ref
+
+    if kind == 'custom':
+        items = _find_by_custom_url(youtube, value)
+    else:
+        params = {
+            'id': {'id': value},
+            'handle': {'forHandle': value},
+            'username': {'forUsername': value},
+        }[kind]
+        items = _list_channels(youtube, **params)
+
+    if not items:
+        raise ValueError("Канал не найден")
+
+    channel = items[0]
+    return {
+        'id': channel['id'],
+        'title': channel['snippet']['title'],
+        'uploads_playlist_id': channel['contentDetails']['relatedPlaylists'].get('uploads')
+    }
+
+def list_channel_playlists(youtube, channel_id):
+    """Список плейлистов канала с etag для быстрого отсева неизменившихся"""
+    playlists = []
+    next_page_token = None
+
+    while True:
+        response = youtube.playlists().list(
+            part='snippet,contentDetails',
+            channelId=channel_id,
+            maxResults=50,
+            pageToken=next_page_token
+        ).execute()
+
+        for item in response['items']:
+            playlists.append({
+                'id': item['id'],
+                'title': item['snippet']['title'],
+                'etag': item['etag']
+            })
+
+        next_page_token = response.get('nextPageToken')
+        if not next_page_token:
+            break
+
+    return playlists
+
+def list_playlist_video_ids(youtube, playlist_id):
+    """ID всех видео плейлиста (без запроса деталей)"""
+    video_ids = []
+    next_page_token = None
+
+    while True:
+        response = youtube.playlistItems().list(
+            part='contentDetails',
+            playlistId=playlist_id,
+            maxResults=50,
+            pageToken=next_page_token
+        ).execute()
+
+        video_ids.extend(i['contentDetails']['videoId'] for i in response['items'])
+
+        next_page_token = response.get('nextPageToken')
+        if not next_page_token:
+            break
+
+    return video_ids
+
+def load_index(path=CHANNEL_INDEX_PATH):
+    """Загрузка локального индекса опубликованного.
+
+    Индекс хранится отдельно для каждого чата: {chat_id: {channel_id: ...}},
+    чтобы канал, уже разобранный в одном чате, целиком публиковался в другом.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_index(index, path=CHANNEL_INDEX_PATH):
+    """Сохранение индекса (через временный файл, чтобы не повредить его при сбое)"""
+    with tempfile.NamedTemporaryFile(
+        'w', encoding='utf-8', dir=os.path.dirname(os.path.abspath(path)),
+        prefix=os.path.basename(path), suffix='.tmp', delete=False
+    ) as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(f.name, path)
+
+def get_chat_index(index, chat_id):
+    """Часть индекса, относящаяся к одному чату"""
+    return index.setdefault(str(chat_id), {})
+
+def update_chat_index(chat_id, update, path=CHANNEL_INDEX_PATH):
+    """Перечитывает индекс, применяет update к части чата и сохраняет.
+
+    Блокировка держится только на время чтения-изменения-записи, поэтому
+    параллельные публикации не затирают отметки друг друга.
+    """
+    with index_lock:
+        index = load_index(path)
+        update(get_chat_index(index, chat_id))
+        save_index(index, path)
+
+def start_channel_run(chat_id, channel_url):
+    """Отмечает начало публикации канала в чате; False, если она уже идёт"""
+    key = (str(chat_id), extract_channel_ref(channel_url))
+    with _running_lock:
+        if key in _running_channels:
+            return False
+        _running_channels.add(key)
+        return True
+
+def finish_channel_run(chat_id, channel_url):
+    """Снимает отметку, поставленную start_channel_run"""
+    with _running_lock:
+        _running_channels.discard((str(chat_id), extract_channel_ref(channel_url)))
+
+def _channel_entry(index, channel_id):
+    return index.setdefault(channel_id, {'playlists': {}, 'videos': []})
+
+def mark_playlist_posted(index, channel_id, playlist):
+    """Отмечаем плейлист опубликованным в индексе"""
+    entry = _channel_entry(index, channel_id)
+    entry['playlists'][playlist['id']] = {
+        'etag': playlist['etag'],
+        'video_ids': playlist['video_ids']
+    }
+
+def mark_video_posted(index, channel_id, video):
+    """Отмечаем отдельное видео опубликованным в индексе"""
+    entry = _channel_entry(index, channel_id)
+    if video['id'] not in entry['videos']:
+        entry['videos'].append(video['id'])
+
+def _fetch_or_skip(fetch, url):
+    """Вызывает парсер и возвращает None вместо исключения, чтобы один
+    проблемный плейлист или видео не останавливал обработку всего канала"""
+    try:
+        return fetch(url)
+    except Exception as e:
+        logging.error(f"Не удалось получить данные {url}, пропускаем: {e}", exc_info=True)
+        return None
+
+def get_channel_updates(channel_url, index, max_workers=CHANNEL_MAX_WORKERS):
+    """Получение новых и изменившихся плейлистов канала и новых отдельных видео.
+
+    Плейлист считается изменившимся, если набор его видео отличается от
+    сохранённого в индексе. etag используется только как быстрый фильтр:
+    плейлисты с прежним etag не перечитываются, а пустые плейлисты и
+    плейлисты с тем же составом, но новым etag (правка описания, обложки)
+    возвращаются в 'unchanged', чтобы вызывающий код записал новый etag в индекс.
+    Сам индекс не изменяется. Отдельными считаются загрузки канала, которые
+    не входят ни в один его плейлист и ещё не были опубликованы.
+    Данные плейлистов и видео запрашиваются параллельно; элементы, которые
+    не удалось получить, пропускаются и не попадают в результат, поэтому
+    будут запрошены снова при следующем запуске.
+    """
+    api_key = os.getenv("YOUTUBE_API_KEY")
+    if not api_key:
+        raise ValueError("API ключ не найден в .env файле")
+
+    ref = extract_channel_ref(channel_url)
+    if not ref:
+        raise ValueError("Некорректная ссылка на канал")
+
+    youtube = build('youtube', 'v3', developerKey=api_key)
+
+    channel = resolve_channel(youtube, ref)
+    entry = index.get(channel['id'], {'playlists': {}, 'videos': []})
+    stored = entry['playlists']
+
+    playlists = list_channel_playlists(youtube, channel['id'])
+    candidates = [p for p in playlists if stored.get(p['id'], {}).get('etag') != p['etag']]
+    candidate_ids = {p['id'] for p in candidates}
+
+    uploads = []
+    if channel['uploads_playlist_id']:
+        try:
+            uploads = list_playlist_video_ids(youtube, channel['uploads_playlist_id'])
+        except HttpError as e:
+            # У канала без публичных загрузок плейлист загрузок отдаёт 404,
+            # плейлисты при этом всё равно обрабатываем
+            logging.warning(f"Не удалось получить загрузки канала {channel['id']}: {e}")
+
+    # Клиент API не потокобезопасен, поэтому каждый поток создаёт свой
+    # (get_playlist_info/get_video_info делают это сами)
+    def fetch_video_ids(playlist_id):
+        return list_playlist_video_ids(build('youtube', 'v3', developerKey=api_key), playlist_id)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        video_ids = executor.map(lambda p: _fetch_or_skip(fetch_video_ids, p['id']), candidates)
+        for playlist, ids in zip(candidates, video_ids):
+            playlist['video_ids'] = ids
+
+        changed = []
+        unchanged = []
+        for p in candidates:
+            if p['video_ids'] is None:
+                continue
+            known = stored.get(p['id'])
+            if not p['video_ids'] or (known is not None and set(known['video_ids']) == set(p['video_ids'])):
+                # Пустой плейлист или состав не изменился: публиковать нечего,
+                # достаточно запомнить etag, чтобы не перечитывать его каждый раз
+                unchanged.append(p)
+            else:
+                changed.append(p)
+
+        playlist_data = executor.map(
+            lambda p: _fetch_or_skip(get_playlist_info, f"https://www.youtube.com/playlist?list={p['id']}"),
+            changed
+        )
+        for playlist, data in zip(changed, playlist_data):
+            playlist['data'] = data
+
+        # Состав перечитанных плейлистов берём из свежих данных, остальных - из индекса
+        in_playlists = set()
+        membership_known = True
+        for p in playlists:
+            if p.get('video_ids') is not None:
+                in_playlists.update(p['video_ids'])
+            elif p['id'] in candidate_ids:
+                membership_known = False
+            else:
+                in_playlists.update(stored[p['id']]['video_ids'])
+        posted = set(entry['videos'])
+
+        new_videos = []
+        if not membership_known:
+            # Состав непрочитанных плейлистов неизвестен: их видео могли бы
+            # ошибочно уйти отдельными постами, поэтому откладываем до следующего запуска
+            logging.warning("Не все плейлисты канала получены, отдельные видео будут обработаны позже")
+        else:
+            new_videos = [
+                {'id': video_id}
+                for video_id in uploads
+                if video_id not in in_playlists and video_id not in posted
+            ]
+        video_data = executor.map(
+            lambda v: _fetch_or_skip(get_video_info, f"https://youtu.be/{v['id']}"),
+            new_videos
+        )
+        for video, data in zip(new_videos, video_data):
+            video['data'] = data
+
+    return {
+        'channel': channel,
+        'playlists': [p for p in changed if p['data']],
+        'unchanged': unchanged,
+        'videos': [v for v in new_videos if v['data']]
+    }
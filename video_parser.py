@@ -24,11 +24,15 @@ def extract_video_id(url):
 
 def parse_duration(duration):
     """Парсинг ISO-8601 продолжительности видео в секунды"""
-    match = re.match(r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?', duration)
-    hours = int(match.group(1)) if match.group(1) else 0
-    minutes = int(match.group(2)) if match.group(2) else 0
-    seconds = int(match.group(3)) if match.group(3) else 0
-    return hours * 3600 + minutes * 60 + seconds
+    # Трансляции и премьеры приходят как P0D, очень длинные видео - как P1DT#H#M#S
+    match = re.match(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$', duration)
+    if not match:
+        return 0
+    days = int(match.group(1)) if match.group(1) else 0
+    hours = int(match.group(2)) if match.group(2) else 0
+    minutes = int(match.group(3)) if match.group(3) else 0
+    seconds = int(match.group(4)) if match.group(4) else 0
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds
 
 def get_max_thumbnail(thumbnails):
     """Выбираем обложку с максимально доступным качеством"""
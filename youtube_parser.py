@@ -16,12 +16,16 @@ def extract_playlist_id(url):
     return params.get('list', [None])[0]
 
 def parse_duration(duration):
-    """Парсинг ISO-8601 продолжительности (PT#H#M#S) в секунды"""
-    match = re.match(r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?', duration)
-    hours = int(match.group(1)) if match.group(1) else 0
-    minutes = int(match.group(2)) if match.group(2) else 0
-    seconds = int(match.group(3)) if match.group(3) else 0
-    return hours * 3600 + minutes * 60 + seconds
+    """Парсинг ISO-8601 продолжительности (P#DT#H#M#S) в секунды"""
+    # Трансляции и премьеры приходят как P0D, очень длинные видео - как P1DT#H#M#S
+    match = re.match(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$', duration)
+    if not match:
+        return 0
+    days = int(match.group(1)) if match.group(1) else 0
+    hours = int(match.group(2)) if match.group(2) else 0
+    minutes = int(match.group(3)) if match.group(3) else 0
+    seconds = int(match.group(4)) if match.group(4) else 0
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds
 
 def get_max_thumbnail(thumbnails):
     """Выбираем обложку с максимально доступным качеством"""
@@ -63,6 +67,8 @@ def get_playlist_info(playlist_url):
         ).execute()
         
         video_ids = [i['snippet']['resourceId']['videoId'] for i in items['items']]
+        if not video_ids:
+            break
         
         # Получение деталей видео
         details = youtube.videos().list(
@@ -70,7 +76,15 @@ def get_playlist_info(playlist_url):
             id=','.join(video_ids)
         ).execute()
         
-        for item, detail in zip(items['items'], details['items']):
+        # videos().list не возвращает приватные и удалённые видео,
+        # поэтому сопоставляем детали с элементами плейлиста по ID
+        details_by_id = {d['id']: d for d in details['items']}
+        
+        for item in items['items']:
+            detail = details_by_id.get(item['snippet']['resourceId']['videoId'])
+            if detail is None:
+                continue
+            
             published = datetime.fromisoformat(
                 item['snippet']['publishedAt'].replace('Z', '+00:00')
             )